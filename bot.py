@@ -9,6 +9,7 @@ from discord.ext import tasks
 import datetime
 from dotenv import load_dotenv
 from agent import MistralAgent
+from workers import WorkerPool
 
 PREFIX = "!"
 
@@ -23,8 +24,12 @@ load_dotenv()
 intents = discord.Intents.all()
 bot = commands.Bot(command_prefix=PREFIX, intents=intents)
 
+# Number of agent worker processes; 0 runs every turn inside this process
+WORKER_COUNT = int(os.getenv("AGENT_WORKERS", "0"))
+
 # Import the Mistral agent from the agent.py file
-agent = MistralAgent()
+# With AGENT_WORKERS set, turns run in worker processes and this process only talks to Discord
+agent = WorkerPool(WORKER_COUNT) if WORKER_COUNT else MistralAgent()
 
 # Get the token from the environment variables
 token = os.getenv("DISCORD_TOKEN")
@@ -188,4 +193,12 @@ async def reset(ctx):
 
 
 # Start the bot, connecting it to the gateway
-bot.run(token)
\ No newline at end of file
+# Worker processes re-import this module, so only the main process may start the bot
+if __name__ == "__main__":
+    if WORKER_COUNT:
+        agent.start()
+    try:
+        bot.run(token)
+    finally:
+        if WORKER_COUNT:
+            agent.close()
@@ -1,6 +1,8 @@
 import requests
 import json
+import sqlite3
 from datetime import datetime
+import fare_store
 
 hotels_url = "https://booking-com.p.rapidapi.com/v2/hotels/search-by-coordinates"
 flights_url = 'https://booking-com15.p.rapidapi.com/api/v1/flights/searchFlights'
@@ -29,6 +31,30 @@ def process_hotel_data(data):
     # Return the processed results
     return processed_results
 
+def use_stored_hotels(latitude, longitude, checkin_date, checkout_date, room_number, adults_number,
+                      children_number):
+    """
+    Answer a failed hotel search with the cheapest stored rates for the same stay.
+    
+    Returns:
+        bool: True if stored rates were written to hotel_options.json
+    """
+    try:
+        stored_hotels = fare_store.cheapest_hotels(
+            latitude, longitude, checkin_date, checkout_date, room_number=room_number,
+            adults_number=adults_number, children_number=children_number, max_age=fare_store.RETENTION
+        )
+    except sqlite3.Error as e:
+        print(f"Snapshot lookup failed: {str(e)}")
+        return False
+    if not stored_hotels:
+        return False
+    
+    print("Live hotel search failed, using stored rates")
+    with open('hotel_options.json', 'w') as json_file:
+        json.dump(stored_hotels, json_file, indent=4)
+    return True
+
 def search_hotels(**kwargs):
     """
     Search for hotels using exact parameter format required by the API.
@@ -70,17 +96,42 @@ def search_hotels(**kwargs):
         "adults_number": int(kwargs.get('adults_number', 1))
     }
 
-    response = requests.get(hotels_url, headers=headers, params=params)
+    # Answer from a recent local snapshot when we have one
+    snapshot_key = (
+        params['latitude'], params['longitude'], params['checkin_date'], params['checkout_date'],
+        params['room_number'], params['adults_number'], params['children_number']
+    )
+    try:
+        cached_data = fare_store.cached_hotels(*snapshot_key)
+    except sqlite3.Error as e:
+        print(f"Snapshot lookup failed, searching live: {str(e)}")
+        cached_data = None
+    if cached_data is not None:
+        with open('hotel_options.json', 'w') as json_file:
+            json.dump(cached_data, json_file, indent=4)
+        return
+
+    try:
+        response = requests.get(hotels_url, headers=headers, params=params)
+    except requests.exceptions.RequestException:
+        if use_stored_hotels(*snapshot_key):
+            return
+        raise
                 
     if response.status_code == 200:
         data = response.json()
         processed_data = process_hotel_data(data)
+        try:
+            fare_store.store_hotels(*snapshot_key, processed_data)
+        except sqlite3.Error as e:
+            print(f"Could not store hotel snapshot: {str(e)}")
         # Save the entire processed data as a JSON file
         with open('hotel_options.json', 'w') as json_file:
             json.dump(processed_data, json_file, indent=4)
     else:
         print(f"Error: {response.status_code}")
         print(response.text)
+        use_stored_hotels(*snapshot_key)
 
 def process_flight_data(raw_data):
     """
@@ -99,7 +150,7 @@ def process_flight_data(raw_data):
         return processed_flights
     
     # Process each flight offer
-    for offer in raw_data["data"]["flightOffers"][:5]:
+    for offer_index, offer in enumerate(raw_data["data"]["flightOffers"][:5]):
         # Look for price information specific to this offer
         # Note: In the snippet provided, individual offer prices weren't visible,
         # so this might need adjustment based on the complete data structure
@@ -124,6 +175,9 @@ def process_flight_data(raw_data):
                 
                 # Flight details
                 "stops": len(segment.get("legs", [])) - 1 if segment.get("legs") else 0,
+                
+                # Segments of the same offer share its index (and its price)
+                "offer_index": offer_index,
             }
             
             # Process legs to get more detailed information
@@ -187,6 +241,32 @@ def format_datetime(datetime_str):
     return None
 
 
+def use_stored_flights(from_id, to_id, depart_date, return_date, adults, children, cabin_class, currency_code):
+    """
+    Answer a failed flight search with the cheapest stored offers for the same trip.
+    
+    Returns:
+        bool: True if stored offers were written to flight_options.json
+    """
+    try:
+        offers = fare_store.cheapest_flights(
+            from_id, to_id, date_from=depart_date, date_to=depart_date, return_date=return_date,
+            adults=adults, children=children, cabin_class=cabin_class, currency_code=currency_code,
+            max_age=fare_store.RETENTION
+        )
+    except sqlite3.Error as e:
+        print(f"Snapshot lookup failed: {str(e)}")
+        return False
+    if not offers:
+        return False
+    
+    print("Live flight search failed, using stored fares")
+    flight_options = [segment for offer in offers for segment in offer["segments"]]
+    with open('flight_options.json', 'w') as json_file:
+        json.dump(flight_options, json_file, indent=4)
+    return True
+
+
 def search_flights(from_id, to_id, depart_date, return_date, page_no, adults, children, sort, cabin_class, currency_code):    
     # Set up headers
     headers = {
@@ -208,6 +288,20 @@ def search_flights(from_id, to_id, depart_date, return_date, page_no, adults, ch
         'currency_code': currency_code
     }
 
+    # Answer from a recent local snapshot when we have one
+    snapshot_key = (
+        from_id, to_id, depart_date, return_date, adults, children, sort, cabin_class, currency_code
+    )
+    try:
+        cached_options = fare_store.cached_flights(*snapshot_key)
+    except sqlite3.Error as e:
+        print(f"Snapshot lookup failed, searching live: {str(e)}")
+        cached_options = None
+    if cached_options is not None:
+        with open('flight_options.json', 'w') as json_file:
+            json.dump(cached_options, json_file, indent=4)
+        return
+
     try:
         # Make the GET request
         response = requests.get(flights_url, headers=headers, params=params)
@@ -216,10 +310,17 @@ def search_flights(from_id, to_id, depart_date, return_date, page_no, adults, ch
         if response.status_code == 200:
             flight_data = response.json()  # Print the entire response for now
             flight_options = process_flight_data(flight_data)
+            try:
+                fare_store.store_flights(*snapshot_key, flight_options)
+            except sqlite3.Error as e:
+                print(f"Could not store flight snapshot: {str(e)}")
             with open('flight_options.json', 'w') as json_file:
                 json.dump(flight_options, json_file, indent=4)
+            return
         else:
             print(f"Error: {response.status_code} - {response.text}")
 
     except requests.exceptions.RequestException as e:
-        print(f"Error: {str(e)}")
\ No newline at end of file
+        print(f"Error: {str(e)}")
+
+    use_stored_flights(from_id, to_id, depart_date, return_date, adults, children, cabin_class, currency_code)
\ No newline at end of file
@@ -0,0 +1,416 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# Snapshot database lives next to the code so every process shares the same file
+DB_PATH = os.getenv(
+    "FARE_SNAPSHOT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fare_snapshots.db")
+)
+# How long (in seconds) a stored fare is considered good enough to answer from
+MAX_AGE = int(os.getenv("FARE_SNAPSHOT_MAX_AGE", "900"))
+# How long (in seconds) snapshots are kept; fares past MAX_AGE are only used when a live search fails
+RETENTION = max(MAX_AGE, int(os.getenv("FARE_SNAPSHOT_RETENTION", "86400")))
+
+# Bump when the tables change; the snapshots are only a cache, so old ones are dropped
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flight_fares (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    depart_date TEXT NOT NULL,
+    return_date TEXT,
+    cabin_class TEXT NOT NULL,
+    adults INTEGER NOT NULL,
+    children TEXT NOT NULL,
+    sort TEXT NOT NULL,
+    currency_code TEXT NOT NULL,
+    snapshot TEXT NOT NULL,
+    offer_index INTEGER NOT NULL,
+    -- Identifies the same offer across snapshots (its segments' departure times and flight numbers)
+    offer_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    stops INTEGER,
+    -- Price of the whole offer (every segment of an offer carries the same price)
+    price REAL,
+    currency TEXT,
+    data TEXT NOT NULL,
+    captured_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_flight_search
+    ON flight_fares (
+        origin, destination, depart_date, return_date, cabin_class, sort, currency_code, captured_at
+    );
+CREATE INDEX IF NOT EXISTS idx_flight_captured
+    ON flight_fares (captured_at);
+CREATE INDEX IF NOT EXISTS idx_flight_route
+    ON flight_fares (origin, destination, depart_date, cabin_class, price);
+CREATE INDEX IF NOT EXISTS idx_flight_offer
+    ON flight_fares (snapshot, offer_index, position);
+
+CREATE TABLE IF NOT EXISTS hotel_rates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    checkin_date TEXT NOT NULL,
+    checkout_date TEXT NOT NULL,
+    room_number INTEGER NOT NULL,
+    adults INTEGER NOT NULL,
+    children INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    price REAL,
+    data TEXT NOT NULL,
+    captured_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hotel_search
+    ON hotel_rates (latitude, longitude, checkin_date, checkout_date, captured_at);
+CREATE INDEX IF NOT EXISTS idx_hotel_captured
+    ON hotel_rates (captured_at);
+CREATE INDEX IF NOT EXISTS idx_hotel_price
+    ON hotel_rates (latitude, longitude, checkin_date, checkout_date, price);
+"""
+
+
+# Database files whose schema has already been set up by this process
+_ready_paths = set()
+_setup_lock = threading.Lock()
+
+
+def _setup(conn):
+    """Switch the database to WAL and create (or rebuild) the tables and indexes."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS flight_fares; DROP TABLE IF EXISTS hotel_rates;")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+
+
+def _connect():
+    """Open the snapshot database, setting up the schema the first time this process uses it."""
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    if DB_PATH not in _ready_paths:
+        with _setup_lock:
+            if DB_PATH not in _ready_paths:
+                try:
+                    _setup(conn)
+                except sqlite3.Error:
+                    conn.close()
+                    raise
+                _ready_paths.add(DB_PATH)
+    return conn
+
+
+def _cutoff(max_age):
+    """Return the oldest capture timestamp still inside the freshness window."""
+    if max_age is None:
+        max_age = MAX_AGE
+    return time.time() - max_age
+
+
+def _airport(code):
+    """Strip the .AIRPORT suffix so codes match however they were written."""
+    if not code:
+        return ""
+    code = code.upper().strip()
+    if code.endswith(".AIRPORT"):
+        code = code[:-len(".AIRPORT")]
+    return code
+
+
+def _coordinate(value):
+    """Round coordinates so nearby estimates of the same city hit the same rows."""
+    return round(float(value), 4)
+
+
+def store_flights(from_id, to_id, depart_date, return_date, adults, children, sort, cabin_class,
+                  currency_code, flights):
+    """
+    Record a snapshot of processed flights for a search.
+
+    Args:
+        flights (list): Output of process_flight_data for this search
+    """
+    if not flights:
+        return
+
+    captured_at = time.time()
+    snapshot = uuid.uuid4().hex
+    offer_indexes = [flight.get("offer_index", position) for position, flight in enumerate(flights)]
+    offer_segments = {}
+    for offer_index, flight in zip(offer_indexes, flights):
+        offer_segments.setdefault(offer_index, []).append([flight.get("departure_time"), flight.get("flight_number")])
+
+    rows = []
+    for position, (offer_index, flight) in enumerate(zip(offer_indexes, flights)):
+        price = flight.get("price") or {}
+        rows.append((
+            _airport(from_id), _airport(to_id), depart_date, return_date or "",
+            cabin_class, int(adults), str(children), sort, currency_code,
+            snapshot, offer_index, json.dumps(offer_segments[offer_index]), position,
+            flight.get("stops", 0), price.get("amount"), price.get("currency"),
+            json.dumps(flight), captured_at
+        ))
+
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                """INSERT INTO flight_fares (
+                    origin, destination, depart_date, return_date, cabin_class, adults, children,
+                    sort, currency_code, snapshot, offer_index, offer_key, position, stops,
+                    price, currency, data, captured_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            conn.execute("DELETE FROM flight_fares WHERE captured_at < ?", (captured_at - RETENTION,))
+    finally:
+        conn.close()
+
+
+def cached_flights(from_id, to_id, depart_date, return_date, adults, children, sort, cabin_class,
+                   currency_code, max_age=None):
+    """
+    Look up the latest snapshot for an exact flight search.
+
+    Returns:
+        list: The stored flights in their original order, or None if there is
+        no snapshot inside the freshness window
+    """
+    key = (
+        _airport(from_id), _airport(to_id), depart_date, return_date or "",
+        cabin_class, int(adults), str(children), sort, currency_code
+    )
+    conn = _connect()
+    try:
+        latest = conn.execute(
+            """SELECT MAX(captured_at) FROM flight_fares
+            WHERE origin = ? AND destination = ? AND depart_date = ? AND return_date = ?
+                AND cabin_class = ? AND adults = ? AND children = ? AND sort = ? AND currency_code = ?
+                AND captured_at >= ?""",
+            key + (_cutoff(max_age),)
+        ).fetchone()[0]
+        if latest is None:
+            return None
+
+        rows = conn.execute(
+            """SELECT data FROM flight_fares
+            WHERE origin = ? AND destination = ? AND depart_date = ? AND return_date = ?
+                AND cabin_class = ? AND adults = ? AND children = ? AND sort = ? AND currency_code = ?
+                AND captured_at = ?
+            ORDER BY position""",
+            key + (latest,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return [json.loads(row[0]) for row in rows]
+
+
+def cheapest_flights(from_id, to_id, limit=5, date_from=None, date_to=None, return_date=None,
+                     adults=None, children=None, cabin_class=None, max_stops=None, currency_code=None,
+                     max_age=None):
+    """
+    Find the cheapest stored offers for a route.
+
+    Offers are compared by their total price, which covers every segment of
+    the offer (outbound and return for a round trip). An offer stored more
+    than once is ranked by its most recent price.
+
+    Args:
+        from_id (str): Origin airport, with or without the .AIRPORT suffix
+        to_id (str): Destination airport, with or without the .AIRPORT suffix
+        limit (int): Maximum number of offers to return
+        date_from (str): Earliest departure date (YYYY-MM-DD), inclusive
+        date_to (str): Latest departure date (YYYY-MM-DD), inclusive
+        return_date (str): Only offers searched with this return date
+        adults (int): Only offers searched for this number of adults
+        children (str): Only offers searched for these children
+        cabin_class (str): ECONOMY, BUSINESS or FIRST
+        max_stops (int): Maximum number of stops on any segment of the offer
+        currency_code (str): Only offers priced in this currency
+        max_age (int): Freshness window in seconds, defaults to FARE_SNAPSHOT_MAX_AGE
+
+    Returns:
+        list: Dictionaries with the offer "price" and its "segments" (in the
+        same shape as process_flight_data), cheapest first
+    """
+    where = "origin = ? AND destination = ? AND price IS NOT NULL AND captured_at >= ?"
+    params = [_airport(from_id), _airport(to_id), _cutoff(max_age)]
+
+    if date_from:
+        where += " AND depart_date >= ?"
+        params.append(date_from)
+    if date_to:
+        where += " AND depart_date <= ?"
+        params.append(date_to)
+    if return_date:
+        where += " AND return_date = ?"
+        params.append(return_date)
+    if adults is not None:
+        where += " AND adults = ?"
+        params.append(int(adults))
+    if children is not None:
+        where += " AND children = ?"
+        params.append(str(children))
+    if cabin_class:
+        where += " AND cabin_class = ?"
+        params.append(cabin_class)
+    if currency_code:
+        where += " AND currency = ?"
+        params.append(currency_code)
+
+    # The same offer shows up in every snapshot that returned it; only its latest one counts
+    query = f"""WITH offers AS (
+            SELECT snapshot, offer_index, offer_key, captured_at, MIN(price) AS price, MAX(stops) AS stops
+            FROM flight_fares WHERE {where}
+            GROUP BY snapshot, offer_index
+        ), latest AS (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY offer_key ORDER BY captured_at DESC) AS recency
+            FROM offers
+        )
+        SELECT snapshot, offer_index FROM latest WHERE recency = 1"""
+    if max_stops is not None:
+        query += " AND stops <= ?"
+        params.append(int(max_stops))
+    query += " ORDER BY price LIMIT ?"
+    params.append(int(limit))
+
+    offers = []
+    conn = _connect()
+    try:
+        for snapshot, offer_index in conn.execute(query, params).fetchall():
+            rows = conn.execute(
+                "SELECT data FROM flight_fares WHERE snapshot = ? AND offer_index = ? ORDER BY position",
+                (snapshot, offer_index)
+            ).fetchall()
+            segments = [json.loads(row[0]) for row in rows]
+            offers.append({"price": segments[0].get("price"), "segments": segments})
+    finally:
+        conn.close()
+
+    return offers
+
+
+def store_hotels(latitude, longitude, checkin_date, checkout_date, room_number, adults_number,
+                 children_number, hotels):
+    """
+    Record a snapshot of processed hotels for a search.
+
+    Args:
+        hotels (list): Output of process_hotel_data for this search
+    """
+    if not hotels:
+        return
+
+    captured_at = time.time()
+    rows = []
+    for position, hotel in enumerate(hotels):
+        rows.append((
+            _coordinate(latitude), _coordinate(longitude), checkin_date, checkout_date,
+            int(room_number), int(adults_number), int(children_number), position,
+            hotel.get("name"), hotel.get("price"), json.dumps(hotel), captured_at
+        ))
+
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                """INSERT INTO hotel_rates (
+                    latitude, longitude, checkin_date, checkout_date, room_number, adults,
+                    children, position, name, price, data, captured_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            conn.execute("DELETE FROM hotel_rates WHERE captured_at < ?", (captured_at - RETENTION,))
+    finally:
+        conn.close()
+
+
+def cached_hotels(latitude, longitude, checkin_date, checkout_date, room_number, adults_number,
+                  children_number, max_age=None):
+    """
+    Look up the latest snapshot for an exact hotel search.
+
+    Returns:
+        list: The stored hotels in their original order, or None if there is
+        no snapshot inside the freshness window
+    """
+    key = (
+        _coordinate(latitude), _coordinate(longitude), checkin_date, checkout_date,
+        int(room_number), int(adults_number), int(children_number)
+    )
+    conn = _connect()
+    try:
+        latest = conn.execute(
+            """SELECT MAX(captured_at) FROM hotel_rates
+            WHERE latitude = ? AND longitude = ? AND checkin_date = ? AND checkout_date = ?
+                AND room_number = ? AND adults = ? AND children = ? AND captured_at >= ?""",
+            key + (_cutoff(max_age),)
+        ).fetchone()[0]
+        if latest is None:
+            return None
+
+        rows = conn.execute(
+            """SELECT data FROM hotel_rates
+            WHERE latitude = ? AND longitude = ? AND checkin_date = ? AND checkout_date = ?
+                AND room_number = ? AND adults = ? AND children = ? AND captured_at = ?
+            ORDER BY position""",
+            key + (latest,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return [json.loads(row[0]) for row in rows]
+
+
+def cheapest_hotels(latitude, longitude, checkin_date, checkout_date, room_number=None, adults_number=None,
+                    children_number=None, limit=5, max_age=None):
+    """
+    Find the cheapest stored hotels for a destination and stay.
+
+    Hotels are compared by their gross price for the whole stay. A hotel
+    stored more than once is ranked by its most recent price.
+
+    Args:
+        room_number (int): Only rates searched for this number of rooms
+        adults_number (int): Only rates searched for this number of adults
+        children_number (int): Only rates searched for this number of children
+
+    Returns:
+        list: Hotel dictionaries in the same shape as process_hotel_data, cheapest first
+    """
+    where = """latitude = ? AND longitude = ? AND checkin_date = ? AND checkout_date = ?
+            AND price IS NOT NULL AND captured_at >= ?"""
+    params = [_coordinate(latitude), _coordinate(longitude), checkin_date, checkout_date, _cutoff(max_age)]
+
+    if room_number is not None:
+        where += " AND room_number = ?"
+        params.append(int(room_number))
+    if adults_number is not None:
+        where += " AND adults = ?"
+        params.append(int(adults_number))
+    if children_number is not None:
+        where += " AND children = ?"
+        params.append(int(children_number))
+
+    # Only the latest rate of each hotel counts
+    query = f"""WITH latest AS (
+            SELECT data, price, ROW_NUMBER() OVER (PARTITION BY name ORDER BY captured_at DESC) AS recency
+            FROM hotel_rates WHERE {where}
+        )
+        SELECT data FROM latest WHERE recency = 1 ORDER BY price LIMIT ?"""
+    params.append(int(limit))
+
+    conn = _connect()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+    return [json.loads(row[0]) for row in rows]
@@ -0,0 +1,134 @@
+import sqlite3
+import time
+
+import pytest
+
+import fare_store
+
+SEARCH = ("JFK.AIRPORT", "LAX.AIRPORT", "2025-03-16", "2025-03-20", 1, "0")
+
+
+def segment(offer_index, departure_airport, arrival_airport, departure_time, flight_number, amount, stops=0):
+    return {
+        "departure_airport": departure_airport,
+        "arrival_airport": arrival_airport,
+        "departure_time": departure_time,
+        "stops": stops,
+        "offer_index": offer_index,
+        "flight_number": flight_number,
+        "price": {"currency": "USD", "amount": amount},
+    }
+
+
+def round_trip(offer_index, flight_number, amount, stops=0):
+    return [
+        segment(offer_index, "JFK", "LAX", "2025-03-16T08:00:00", flight_number, amount, stops),
+        segment(offer_index, "LAX", "JFK", "2025-03-20T18:00:00", flight_number + 1, amount),
+    ]
+
+
+@pytest.fixture(autouse=True)
+def snapshot_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(fare_store, "DB_PATH", str(tmp_path / "snapshots.db"))
+
+
+def test_cached_flights_misses_until_stored():
+    assert fare_store.cached_flights(*SEARCH, "BEST", "ECONOMY", "USD") is None
+
+    flights = round_trip(0, 100, 500.0) + round_trip(1, 200, 300.0)
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", flights)
+
+    assert fare_store.cached_flights(*SEARCH, "BEST", "ECONOMY", "USD") == flights
+
+
+def test_cached_flights_keys_on_sort_and_currency():
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 100, 500.0))
+
+    assert fare_store.cached_flights(*SEARCH, "PRICE", "ECONOMY", "USD") is None
+    assert fare_store.cached_flights(*SEARCH, "BEST", "ECONOMY", "EUR") is None
+
+
+def test_cached_flights_respects_freshness_window():
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 100, 500.0))
+
+    assert fare_store.cached_flights(*SEARCH, "BEST", "ECONOMY", "USD", max_age=-1) is None
+
+
+def test_store_prunes_expired_rows(monkeypatch):
+    monkeypatch.setattr(fare_store, "RETENTION", 0)
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 100, 500.0))
+    time.sleep(0.01)
+    fare_store.store_flights(*SEARCH, "PRICE", "ECONOMY", "USD", round_trip(0, 100, 500.0))
+
+    conn = sqlite3.connect(fare_store.DB_PATH)
+    assert conn.execute("SELECT DISTINCT sort FROM flight_fares").fetchall() == [("PRICE",)]
+    conn.close()
+
+
+def test_cheapest_flights_ranks_whole_offers():
+    flights = round_trip(0, 100, 500.0) + round_trip(1, 200, 300.0, stops=2) + round_trip(2, 300, 400.0)
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", flights)
+    # A second snapshot of the same offers must not produce duplicates
+    fare_store.store_flights(*SEARCH, "PRICE", "ECONOMY", "USD", flights)
+
+    offers = fare_store.cheapest_flights("JFK", "LAX", limit=5)
+    assert [offer["price"]["amount"] for offer in offers] == [300.0, 400.0, 500.0]
+    assert [len(offer["segments"]) for offer in offers] == [2, 2, 2]
+    assert offers[0]["segments"][1]["departure_airport"] == "LAX"
+
+    offers = fare_store.cheapest_flights("JFK.AIRPORT", "LAX.AIRPORT", limit=1, max_stops=1)
+    assert [offer["price"]["amount"] for offer in offers] == [400.0]
+
+
+def test_cheapest_flights_filters_dates_and_currency():
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 100, 500.0))
+
+    assert fare_store.cheapest_flights("JFK", "LAX", date_from="2025-03-17") == []
+    assert fare_store.cheapest_flights("JFK", "LAX", date_to="2025-03-15") == []
+    assert fare_store.cheapest_flights("JFK", "LAX", currency_code="EUR") == []
+    assert len(fare_store.cheapest_flights("JFK", "LAX", date_from="2025-03-16", date_to="2025-03-16")) == 1
+
+
+def test_hotels_round_trip_and_cheapest():
+    stay = (40.776676, -73.971321, "2025-03-16", "2025-03-20")
+    hotels = [{"name": "Plaza", "price": 900.0}, {"name": "Pod", "price": 250.5}]
+    fare_store.store_hotels(*stay, 1, 1, 1, hotels)
+
+    assert fare_store.cached_hotels(40.7766761, -73.971321, "2025-03-16", "2025-03-20", 1, 1, 1) == hotels
+    assert [hotel["name"] for hotel in fare_store.cheapest_hotels(*stay)] == ["Pod", "Plaza"]
+
+
+def test_cheapest_flights_filters_travellers():
+    family = ("JFK.AIRPORT", "LAX.AIRPORT", "2025-03-16", "2025-03-20", 4, "2")
+    fare_store.store_flights(*family, "BEST", "ECONOMY", "USD", round_trip(0, 100, 1900.0))
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 200, 300.0))
+
+    offers = fare_store.cheapest_flights("JFK", "LAX", adults=4, children="2")
+    assert [offer["price"]["amount"] for offer in offers] == [1900.0]
+    offers = fare_store.cheapest_flights("JFK", "LAX", adults=1, children="0")
+    assert [offer["price"]["amount"] for offer in offers] == [300.0]
+
+
+def test_cheapest_hotels_filters_rooms_and_guests():
+    stay = (40.776676, -73.971321, "2025-03-16", "2025-03-20")
+    fare_store.store_hotels(*stay, 3, 6, 0, [{"name": "Plaza", "price": 1200.0}])
+    fare_store.store_hotels(*stay, 1, 1, 0, [{"name": "Plaza", "price": 200.0}])
+
+    assert fare_store.cheapest_hotels(*stay, 3, 6, 0) == [{"name": "Plaza", "price": 1200.0}]
+    assert fare_store.cheapest_hotels(*stay, 1, 1, 0) == [{"name": "Plaza", "price": 200.0}]
+
+
+def test_cheapest_uses_latest_price():
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 100, 300.0))
+    time.sleep(0.01)
+    fare_store.store_flights(*SEARCH, "BEST", "ECONOMY", "USD", round_trip(0, 100, 450.0))
+
+    offers = fare_store.cheapest_flights("JFK", "LAX")
+    assert [offer["price"]["amount"] for offer in offers] == [450.0]
+
+    stay = (40.776676, -73.971321, "2025-03-16", "2025-03-20")
+    fare_store.store_hotels(*stay, 1, 1, 0, [{"name": "Plaza", "price": 300.0}])
+    time.sleep(0.01)
+    fare_store.store_hotels(*stay, 1, 1, 0, [{"name": "Plaza", "price": 450.0}])
+
+    assert fare_store.cheapest_hotels(*stay) == [{"name": "Plaza", "price": 450.0}]
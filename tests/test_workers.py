@@ -0,0 +1,163 @@
+import asyncio
+import os
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from workers import EchoAgent, FakeChannel, WorkerPool, fake_gateway
+
+# Snowflake-sized Discord user ids
+USER_IDS = [
+    1187469374021828638, 1094827461295601732, 998127340681924649, 1210045583392157716,
+    1065390021477691402, 873450912384710656, 1152094467329065000, 1029384756102938475,
+]
+REPLY = re.compile(r"Worker (\d+) handled turn (\d+) for user (\d+): (.*)")
+
+
+class SlowChannel(FakeChannel):
+    """A channel whose first send takes longer than the ones after it."""
+
+    async def send(self, content):
+        await asyncio.sleep(0.2 if not self.sent and content.endswith("first") else 0)
+        self.sent.append(content)
+        if content == "fail":
+            raise RuntimeError("Discord rejected the message")
+
+
+class StatusAgent(EchoAgent):
+    """Sends each comma-separated word of the message as its own status message."""
+
+    async def run(self, message):
+        for status in message.content.split(","):
+            await message.channel.send(status)
+        return "done"
+
+
+class CrashAgent(EchoAgent):
+    """Kills its worker on "crash" and blocks its whole event loop on "hang"."""
+
+    async def run(self, message):
+        if message.content == "crash":
+            os._exit(1)
+        if message.content == "hang":
+            # Like a requests.get call without a timeout
+            time.sleep(30)
+        return await super().run(message)
+
+
+@pytest.fixture(autouse=True)
+def worker_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_WORKER_DIR", str(tmp_path))
+
+
+def run_with_pool(pool, scenario):
+    async def main():
+        pool.start()
+        try:
+            return await scenario(pool)
+        finally:
+            pool.close()
+
+    return asyncio.run(main())
+
+
+def message(user_id, content):
+    return SimpleNamespace(author=SimpleNamespace(id=user_id), content=content, channel=FakeChannel())
+
+
+def test_turns_stay_ordered_and_sticky():
+    turns = 3
+    results = run_with_pool(WorkerPool(2, agent_path="workers:EchoAgent"),
+                            lambda pool: fake_gateway(pool, USER_IDS, turns))
+
+    workers = set()
+    for user_id, (replies, channel) in results.items():
+        parsed = [REPLY.match(reply).groups() for reply in replies]
+        assert [turn for _, turn, _, _ in parsed] == [str(turn + 1) for turn in range(turns)]
+        assert [content for _, _, _, content in parsed] == [f"message {turn + 1}" for turn in range(turns)]
+        assert {user for _, _, user, _ in parsed} == {str(user_id)}
+
+        pids = {pid for pid, _, _, _ in parsed}
+        assert len(pids) == 1
+        pid = pids.pop()
+        workers.add(pid)
+
+        # Status messages sent inside a worker reach the user's channel
+        assert len(channel.sent) == turns
+        assert all(status.startswith(f"🔍 Worker {pid}") for status in channel.sent)
+
+    assert len(workers) == 2
+
+
+def test_crashed_worker_fails_turn_and_keeps_session():
+    async def scenario(pool):
+        first = await pool.run(message(USER_IDS[0], "hello"))
+        with pytest.raises(RuntimeError):
+            await pool.run(message(USER_IDS[0], "crash"))
+        second = await pool.run(message(USER_IDS[0], "again"))
+        return first, second, pool.pending
+
+    first, second, pending = run_with_pool(WorkerPool(1, agent_path="test_workers:CrashAgent", timeout=30), scenario)
+
+    first_pid, first_turn, _, _ = REPLY.match(first).groups()
+    second_pid, second_turn, _, _ = REPLY.match(second).groups()
+    assert first_pid != second_pid
+    assert (first_turn, second_turn) == ("1", "2")
+    assert pending == {}
+
+
+def test_stuck_turn_times_out_and_replaces_worker():
+    async def scenario(pool):
+        first = await pool.run(message(USER_IDS[0], "hello"))
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(message(USER_IDS[0], "hang"))
+        second = await pool.run(message(USER_IDS[0], "again"))
+        return first, second, pool.pending
+
+    first, second, pending = run_with_pool(WorkerPool(1, agent_path="test_workers:CrashAgent", timeout=2), scenario)
+
+    first_pid, first_turn, _, _ = REPLY.match(first).groups()
+    second_pid, second_turn, _, _ = REPLY.match(second).groups()
+    assert first_pid != second_pid
+    # The timed out turn never made it into the session
+    assert (first_turn, second_turn) == ("1", "2")
+    assert pending == {}
+
+
+def test_status_messages_are_sent_in_order_before_the_result():
+    async def scenario(pool):
+        channel = SlowChannel()
+        result = await pool.run(SimpleNamespace(author=SimpleNamespace(id=USER_IDS[0]),
+                                                content="first,second,third", channel=channel))
+        return result, channel.sent
+
+    result, sent = run_with_pool(WorkerPool(1, agent_path="test_workers:StatusAgent"), scenario)
+    assert result == "done"
+    assert sent == ["first", "second", "third"]
+
+
+def test_status_message_errors_reach_the_caller():
+    async def scenario(pool):
+        with pytest.raises(RuntimeError, match="Discord rejected"):
+            await pool.run(SimpleNamespace(author=SimpleNamespace(id=USER_IDS[0]), content="fail",
+                                           channel=SlowChannel()))
+
+    run_with_pool(WorkerPool(1, agent_path="test_workers:StatusAgent"), scenario)
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_close_after_the_event_loop_has_closed():
+    pool = WorkerPool(1, agent_path="test_workers:StatusAgent")
+    pool.start()
+
+    # Like bot.run: the loop closes with a turn still queued, then the pool is closed
+    async def leave_turn_queued():
+        pool.submit("run", str(USER_IDS[0]), "a,b,c", FakeChannel())
+
+    asyncio.run(leave_turn_queued())
+    pool.close()
+
+    assert all(not listener.is_alive() for listener in pool.listeners)
+    assert all(not process.is_alive() for process in pool.processes)
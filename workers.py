@@ -0,0 +1,359 @@
+import os
+import time
+import asyncio
+import argparse
+import importlib
+import itertools
+import queue
+import random
+import threading
+import multiprocessing
+import zlib
+from collections import defaultdict
+from types import SimpleNamespace
+
+# Each worker gets its own working directory so the *_options.json files never collide
+WORKER_DIR = os.getenv(
+    "AGENT_WORKER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker_data")
+)
+# Seconds the gateway waits for a worker to answer a turn
+TURN_TIMEOUT = float(os.getenv("AGENT_TURN_TIMEOUT", "120"))
+
+
+class TurnChannel:
+    """Stands in for message.channel inside a worker, forwarding sends to the gateway."""
+
+    def __init__(self, outbox, turn_id):
+        self.outbox = outbox
+        self.turn_id = turn_id
+
+    async def send(self, content):
+        self.outbox.put(("send", self.turn_id, content))
+
+
+class TurnMessage:
+    """The parts of a discord.Message the agent reads, rebuilt inside a worker."""
+
+    def __init__(self, user_id, content, channel):
+        self.author = SimpleNamespace(id=user_id)
+        self.content = content
+        self.channel = channel
+
+
+def load_session(agent, sessions, user_id):
+    """Copy a user's shared session state into the worker's agent."""
+    session = sessions.get(user_id)
+    if session is not None:
+        agent.conversation_history[user_id] = session["conversation_history"]
+        agent.user_data[user_id] = session["user_data"]
+
+
+def save_session(agent, sessions, user_id):
+    """Publish a user's session state so any worker can pick it up."""
+    sessions[user_id] = {
+        "conversation_history": list(agent.conversation_history[user_id]),
+        "user_data": dict(agent.user_data[user_id])
+    }
+
+
+async def handle_turn(agent, job, lock, outbox, sessions):
+    """Run one queued job for a user and report the result to the gateway."""
+    kind, turn_id, user_id, content = job
+    async with lock:
+        try:
+            load_session(agent, sessions, user_id)
+            if kind == "reset":
+                agent.reset_conversation(user_id)
+                result = None
+            else:
+                message = TurnMessage(user_id, content, TurnChannel(outbox, turn_id))
+                result = await agent.run(message)
+            save_session(agent, sessions, user_id)
+            outbox.put(("done", turn_id, result))
+        except Exception as e:
+            outbox.put(("error", turn_id, str(e)))
+
+
+async def serve(agent, inbox, outbox, sessions):
+    """Pull jobs off the inbox until the gateway sends None."""
+    loop = asyncio.get_running_loop()
+    # Turns for different users overlap; turns for the same user stay in order
+    locks = defaultdict(asyncio.Lock)
+    tasks = set()
+
+    while True:
+        job = await loop.run_in_executor(None, inbox.get)
+        if job is None:
+            break
+        task = asyncio.create_task(handle_turn(agent, job, locks[job[2]], outbox, sessions))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def worker_main(index, agent_path, inbox, outbox, sessions):
+    """Entry point of a worker process."""
+    module_name, class_name = agent_path.split(":")
+    agent_class = getattr(importlib.import_module(module_name), class_name)
+
+    workdir = os.path.join(WORKER_DIR, f"worker-{index}")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    asyncio.run(serve(agent_class(), inbox, outbox, sessions))
+
+
+class WorkerPool:
+    """
+    Runs agent turns in a pool of worker processes.
+
+    Exposes the same run/reset_conversation interface as MistralAgent, so the
+    gateway can use it in place of the agent. Each user is pinned to one worker
+    and their session state is kept in a shared dict.
+    """
+
+    def __init__(self, size, agent_path="agent:MistralAgent", timeout=TURN_TIMEOUT):
+        self.size = size
+        self.agent_path = agent_path
+        self.timeout = timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.turn_ids = itertools.count()
+        # turn_id -> (future, channel, worker index, tasks sending its status messages)
+        self.pending = {}
+        self.loop = None
+        self.closing = False
+        self.listeners = []
+        self.processes = []
+        self.inboxes = []
+        self.outboxes = []
+
+    def start(self):
+        """Start the session manager and the workers."""
+        self.manager = self.context.Manager()
+        self.sessions = self.manager.dict()
+
+        for index in range(self.size):
+            self.processes.append(None)
+            self.inboxes.append(None)
+            self.outboxes.append(None)
+            self.start_worker(index)
+
+    def start_worker(self, index):
+        """Start a worker with its own queues and a listener thread for its results."""
+        # Queues are never reused: a process killed while using one may leave it unusable
+        self.inboxes[index] = self.context.Queue()
+        self.outboxes[index] = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.agent_path, self.inboxes[index], self.outboxes[index], self.sessions),
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+        listener = threading.Thread(target=self.listen, args=(index, self.outboxes[index]), daemon=True)
+        listener.start()
+        self.listeners.append(listener)
+
+    def restart_worker(self, index, process):
+        """Replace a dead worker and fail the turns it was handling."""
+        if self.closing or self.processes[index] is not process or process.is_alive():
+            return
+        self.start_worker(index)
+
+        for turn_id, (future, channel, worker, sends) in list(self.pending.items()):
+            if worker != index:
+                continue
+            del self.pending[turn_id]
+            if future is not None and not future.done():
+                future.set_exception(RuntimeError(f"Agent worker {index} stopped while handling this turn"))
+
+    def stop_worker(self, index, process):
+        """Kill a worker that stopped answering and replace it."""
+        if self.processes[index] is not process:
+            return
+        # A turn blocked in sync code holds up every user on the worker, so it cannot be left running
+        process.terminate()
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        self.restart_worker(index, process)
+
+    def worker_for(self, user_id):
+        """Pick the worker a user is pinned to."""
+        index = zlib.crc32(user_id.encode()) % self.size
+        # The user's session survives a restart in the shared dict
+        self.restart_worker(index, self.processes[index])
+        return index
+
+    def listen(self, index, outbox):
+        """Forward one worker's events to the event loop (runs in a background thread)."""
+        # Keep draining while closing, so workers can flush their last results and exit
+        while self.outboxes[index] is outbox:
+            try:
+                event = outbox.get(timeout=1)
+            except queue.Empty:
+                # Notice crashed workers even when none of their users are talking
+                process = self.processes[index]
+                if not self.closing and not process.is_alive():
+                    self.call_in_loop(self.restart_worker, index, process)
+                continue
+            if event is None:
+                break
+            self.call_in_loop(self.dispatch, *event)
+
+    def call_in_loop(self, callback, *args):
+        """Schedule a callback on the gateway's event loop unless it has already closed."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop closed between the check and the call; nobody is waiting any more
+            pass
+
+    def dispatch(self, kind, turn_id, payload):
+        if turn_id not in self.pending:
+            return
+        future, channel, worker, sends = self.pending[turn_id]
+
+        if kind == "send":
+            previous = sends[-1] if sends else None
+            sends.append(self.loop.create_task(self.forward(previous, channel, payload)))
+            return
+
+        del self.pending[turn_id]
+        if future is None or future.done():
+            return
+        if kind == "error":
+            future.set_exception(RuntimeError(payload))
+        else:
+            future.set_result(payload)
+
+    async def forward(self, previous, channel, content):
+        """Send a status message once the turn's earlier ones are out."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        await channel.send(content)
+
+    def submit(self, kind, user_id, content="", channel=None):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        turn_id = next(self.turn_ids)
+        future = self.loop.create_future() if kind == "run" else None
+        index = self.worker_for(user_id)
+        self.pending[turn_id] = (future, channel, index, [])
+        self.inboxes[index].put((kind, turn_id, user_id, content))
+        return turn_id, future
+
+    async def run(self, message):
+        turn_id, future = self.submit("run", str(message.author.id), message.content, message.channel)
+        _, _, index, sends = self.pending[turn_id]
+        process = self.processes[index]
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # Killing the worker also stops the stuck turn from saving itself into the session
+            self.stop_worker(index, process)
+            raise
+        finally:
+            self.pending.pop(turn_id, None)
+
+        # Status messages must be out before the caller replies with the result
+        await asyncio.gather(*sends)
+        return result
+
+    def reset_conversation(self, user_id: str):
+        """Reset a user's session on the worker they are pinned to."""
+        self.submit("reset", user_id)
+
+    def close(self):
+        """Stop the workers once their queued turns have finished."""
+        self.closing = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=30)
+        for outbox in self.outboxes:
+            outbox.put(None)
+        for listener in self.listeners:
+            listener.join(timeout=5)
+        self.manager.shutdown()
+
+
+class EchoAgent:
+    """Stand-in agent for exercising the worker pool without Discord or Mistral."""
+
+    def __init__(self):
+        self.conversation_history = defaultdict(list)
+        self.user_data = defaultdict(dict)
+
+    async def run(self, message):
+        user_id = str(message.author.id)
+        self.conversation_history[user_id].append({"role": "user", "content": message.content})
+        turn = len(self.conversation_history[user_id])
+        await message.channel.send(f"🔍 Worker {os.getpid()} is working on turn {turn}...")
+        return f"Worker {os.getpid()} handled turn {turn} for user {user_id}: {message.content}"
+
+    def reset_conversation(self, user_id: str):
+        self.conversation_history[user_id] = []
+        self.user_data[user_id] = {}
+
+
+class FakeChannel:
+    """Collects what the pool sends to a channel."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+async def fake_gateway(pool, user_ids, turns):
+    """
+    Drive the pool with concurrent messages from several users, like the real gateway would.
+
+    Returns:
+        dict: The replies and the FakeChannel of each user id
+    """
+    async def converse(user_id):
+        channel = FakeChannel()
+        replies = []
+        for turn in range(turns):
+            message = SimpleNamespace(author=SimpleNamespace(id=user_id), content=f"message {turn + 1}", channel=channel)
+            replies.append(await pool.run(message))
+        return user_id, (replies, channel)
+
+    return dict(await asyncio.gather(*(converse(user_id) for user_id in user_ids)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the worker pool against a fake gateway")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--agent", default="workers:EchoAgent")
+    args = parser.parse_args()
+
+    # Discord user ids are 64-bit snowflakes
+    user_ids = [random.randint(10**17, 2**63 - 1) for _ in range(args.users)]
+
+    pool = WorkerPool(args.workers, agent_path=args.agent)
+    pool.start()
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(fake_gateway(pool, user_ids, args.turns))
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.close()
+
+    for user_id, (replies, channel) in results.items():
+        workers = {reply.split()[1] for reply in replies}
+        print(f"User {user_id}: {len(replies)} replies from worker(s) {', '.join(sorted(workers))}, "
+              f"{len(channel.sent)} status messages, last reply: {replies[-1]}")
+    print(f"{args.users * args.turns} turns in {elapsed:.2f}s")